@@ -11,81 +11,213 @@ import zipfile
 import hashlib
 import hmac
 import tempfile
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from PIL import Image
+import gc
+import contextlib
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat, islice
 import logging
 import html
+from functools import lru_cache
+from collections import namedtuple
+
+try:
+    import orjson  # Rust JSON encoder, used for the audit log when installed
+except ImportError:
+    orjson = None
 
 # ===== CONFIG (dapat di-set via environment) =====
-MAX_WORKERS = int(os.environ.get("MAX_WORKERS", "6"))
+MAX_WORKERS = int(os.environ.get("MAX_WORKERS", str(os.cpu_count() or 1)))
 MAX_FILE_SIZE_BYTES = int(os.environ.get("MAX_FILE_SIZE_BYTES", str(50 * 1024 * 1024)))  # 50 MB
 REQUIRE_SIGNATURE = os.environ.get("REQUIRE_SIGNATURE", "0") == "1"
 SIGNATURE_SECRET = os.environ.get("SIGNATURE_SECRET", "")
-RATE_LIMIT_DELAY_SECONDS = float(os.environ.get("RATE_LIMIT_DELAY_SECONDS", "0.01"))  # small per-task delay
 AUDIT_LOG_PATH = os.environ.get("AUDIT_LOG_PATH", "/tmp/generate_audit.jsonl")
 APP_LOG_PATH = os.environ.get("APP_LOG_PATH", "/tmp/generate.log")
 MAX_QR_CONTENT_LENGTH = int(os.environ.get("MAX_QR_CONTENT_LENGTH", "500"))
+QR_CACHE_SIZE = int(os.environ.get("QR_CACHE_SIZE", "4096"))  # rendered PNGs kept per worker
+CHUNK_SIZE = int(os.environ.get("CHUNK_SIZE", "256"))  # rows per task sent to a worker
+# tmp file + rename per PNG; costs an extra rename per file, so only on request
+# (a crash without it can leave a truncated PNG that later runs skip as existing)
+ATOMIC_WRITES = os.environ.get("ATOMIC_WRITES", "0") == "1" or REQUIRE_SIGNATURE
+# where signed uploads are copied; default is the system temp dir. Point it at
+# tmpfs (e.g. /dev/shm) to keep the copy in RAM, but size it for concurrent
+# uploads of MAX_FILE_SIZE_BYTES (Docker's default /dev/shm is only 64 MB)
+SANDBOX_DIR = os.environ.get("SANDBOX_DIR") or None
+# ==================================================
+
+# ===== Worker processes =====
+# forkserver children start from a clean server process instead of forking the
+# Flask process, so they inherit neither its memory nor its threads/sockets;
+# preloading this module keeps per-run worker startup cheap
+if "forkserver" in multiprocessing.get_all_start_methods():
+    MP_CONTEXT = multiprocessing.get_context("forkserver")
+    MP_CONTEXT.set_forkserver_preload([__name__])
+else:
+    MP_CONTEXT = multiprocessing.get_context()
 # ==================================================
 
 # ===== LOGGING =====
-logging.basicConfig(
-    filename=APP_LOG_PATH,
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s'
-)
+def setup_logging():
+    # also called from init_worker so worker processes log too
+    logging.basicConfig(
+        filename=APP_LOG_PATH,
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s'
+    )
+
+setup_logging()
 # ===================
 
 # ===== Helper security utilities =====
-def sanitize_filename(name: str) -> str:
-    name = re.sub(r'[^a-zA-Z0-9._-]', '_', name)
-    return name.strip("_") or "file"
-
-def sanitize_folder(name: str) -> str:
-    name = re.sub(r'[^a-zA-Z0-9_-]', '_', name)
-    return name.strip("_") or "folder"
-
-def clean_number(value: str) -> str:
-    return re.sub(r'\D', '', value)
+# compiled once, used by the vectorized column helpers below
+_FN_SANITIZE = re.compile(r'[^a-zA-Z0-9._-]')
+_DIR_SANITIZE = re.compile(r'[^a-zA-Z0-9_-]')
+_DIGITS_STRIP = re.compile(r'\D')
+_NUMBER_16 = re.compile(r'\d{16}')
 
 def valid_number(value: str, length: int) -> bool:
     return value.isdigit() and len(value) == length
 
+# applied once over whole DataFrame columns
+def str_series(series: pd.Series) -> pd.Series:
+    # like str(value) per cell: missing cells become "nan" (pandas 3's
+    # astype(str) would keep them missing)
+    return series.astype(object).fillna("nan").astype(str)
+
+def sanitize_filename_series(series: pd.Series) -> pd.Series:
+    series = str_series(series).str.replace(_FN_SANITIZE, '_', regex=True)
+    return series.str.strip("_").replace("", "file")
+
+def sanitize_folder_series(series: pd.Series) -> pd.Series:
+    series = str_series(series).str.replace(_DIR_SANITIZE, '_', regex=True)
+    return series.str.strip("_").replace("", "folder")
+
+def clean_number_series(series: pd.Series) -> pd.Series:
+    return str_series(series).str.replace(_DIGITS_STRIP, '', regex=True)
+
 def sha256_hex(value: str) -> str:
     return hashlib.sha256(value.encode('utf-8')).hexdigest()
 
 def hmac_verify_filepath(file_path: str, signature: str, secret: str) -> bool:
-    # compute HMAC-SHA256 over file bytes
-    h = hmac.new(secret.encode('utf-8'), digestmod=hashlib.sha256)
+    # compute HMAC-SHA256 over file bytes (file_digest reads 256 KiB at a time into one reused buffer)
     with open(file_path, 'rb') as f:
-        for chunk in iter(lambda: f.read(8192), b""):
-            h.update(chunk)
+        h = hashlib.file_digest(f, lambda: hmac.new(secret.encode('utf-8'), digestmod=hashlib.sha256))
     computed = h.hexdigest()
     return hmac.compare_digest(computed, signature)
 
+# ===== Audit log =====
+# one buffered append handle in the main process; worker processes only
+# forward entries through _audit_queue so they never append to the file.
+# run_generate closes the handle when it returns or fails, so every run reopens
+# AUDIT_LOG_PATH and picks up a file moved away by logrotate.
+_audit_fh = None
+_audit_lock = threading.Lock()
+_audit_queue = None
+
+def _audit_dumps(entry: dict) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(entry)
+    return json.dumps(entry, ensure_ascii=False).encode('utf-8')
+
 def audit_write(entry: dict):
+    global _audit_fh
     try:
-        with open(AUDIT_LOG_PATH, 'a', encoding='utf-8') as fh:
-            fh.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        if _audit_queue is not None:
+            _audit_queue.put(entry)
+            return
+        line = _audit_dumps(entry) + b"\n"
+        with _audit_lock:
+            if _audit_fh is None:
+                _audit_fh = open(AUDIT_LOG_PATH, 'ab', buffering=1 << 16)
+            _audit_fh.write(line)
     except Exception as e:
         logging.error(f"Failed to write audit log: {e}")
 
-# ===== QR generation (thread-safe & rate-limited per task) =====
+def audit_flush():
+    try:
+        with _audit_lock:
+            if _audit_fh is not None:
+                _audit_fh.flush()
+    except Exception as e:
+        logging.error(f"Failed to flush audit log: {e}")
+
+def audit_close():
+    global _audit_fh
+    try:
+        with _audit_lock:
+            if _audit_fh is not None:
+                fh, _audit_fh = _audit_fh, None
+                fh.close()
+    except Exception as e:
+        logging.error(f"Failed to close audit log: {e}")
+
+def _audit_drain(queue):
+    # runs as a thread in the main process until the None sentinel arrives
+    for entry in iter(queue.get, None):
+        audit_write(entry)
+
+def audit_row(row_idx: int, nik: str, no_kk: str, action: str, message: str):
+    # for rows settled in run_generate that never reach a worker
+    audit_write({
+        "ts": time.time(),
+        "row_idx": row_idx,
+        "nik_hash": sha256_hex(nik) if nik else None,
+        "kk_hash": sha256_hex(no_kk) if no_kk else None,
+        "action": action,
+        "message": message
+    })
+
+def audit_invalid(row_idx: int, nik: str, no_kk: str):
+    # rows rejected by the vectorized NIK/KK check
+    audit_row(row_idx, nik, no_kk, "invalid", "invalid_nik" if not valid_number(nik, 16) else "invalid_kk")
+
+# ===== QR generation (runs in worker processes) =====
+def init_worker(audit_queue):
+    # ProcessPoolExecutor initializer
+    global _audit_queue
+    setup_logging()
+    _audit_queue = audit_queue
+
+# pre-cleaned per-row fields handed to workers; module-level so it pickles
+QRRow = namedtuple("QRRow", ["nik", "kk", "filename", "kec", "kel", "kode_qr", "valid"])
+
+@lru_cache(maxsize=QR_CACHE_SIZE)
+def _render_qr_png_bytes(qr_value: str) -> bytes:
+    # duplicate KODE QR values skip the full encode; module-level, so each worker has its own cache
+    qr = qrcode.QRCode(
+        version=3,
+        error_correction=qrcode.constants.ERROR_CORRECT_H,
+        # render at final size directly (identical to box_size=10 + 6x upscale)
+        box_size=60,
+        border=4,
+    )
+    qr.add_data(qr_value)
+    qr.make(fit=True)
+
+    # keep the native 1-bit image; RGB only inflates the PNG.
+    # make_image fills one ImageDraw rectangle (C) per dark module; building the
+    # pixels with numpy (repeat + Image.frombuffer) measured no faster, and the
+    # PNG encode below dominates the render time anyway.
+    img = qr.make_image(fill_color="black", back_color="white")
+    buf = io.BytesIO()
+    img.save(buf, format="PNG", optimize=False, compress_level=1)
+    return buf.getvalue()
+
 def generate_qr(row_idx: int, row, base_folder: str):
     """
-    Process a single row and return tuple (status, message).
+    Process a single row and return tuple (status, message, png_bytes).
+    For "ok" the message is the path relative to base_folder, used as the
+    ZIP member name, and png_bytes holds the image.
+    row is a pre-cleaned, pre-validated QRRow built in run_generate whose
+    file does not exist yet; base_folder must be an absolute, normalized path.
     Also write a JSON audit line per-row (without leaking raw NIK/KK).
     """
-    # very small rate-limit per worker to avoid spikes to filesystem
-    if RATE_LIMIT_DELAY_SECONDS > 0:
-        time.sleep(RATE_LIMIT_DELAY_SECONDS)
-
     try:
-        nik_raw = str(row["NO IDENTITAS"])
-        kk_raw = str(row["NOMOR KK"])
-        nik = clean_number(nik_raw)
-        no_kk = clean_number(kk_raw)
-        nama = sanitize_filename(str(row["NAMA LENGKAP"]).replace(" ", "_"))
-        qr_value = html.escape(str(row["KODE QR"]).strip())
+        nik = row.nik
+        no_kk = row.kk
+        filename = row.filename
+        qr_value = html.escape(str(row.kode_qr).strip())
 
         # audit skeleton (non-sensitive)
         audit = {
@@ -97,78 +229,44 @@ def generate_qr(row_idx: int, row, base_folder: str):
             "message": None
         }
 
-        if not valid_number(nik, 16):
-            audit["action"] = "invalid"
-            audit["message"] = "invalid_nik"
-            audit_write(audit)
-            return ("invalid", f"Invalid NIK: {nik}")
-
-        if not valid_number(no_kk, 16):
-            audit["action"] = "invalid"
-            audit["message"] = "invalid_kk"
-            audit_write(audit)
-            return ("invalid", f"Invalid KK: {no_kk}")
-
-        kec = sanitize_folder(str(row.get("KECAMATAN", "Kecamatan")))
-        kel = sanitize_folder(str(row.get("KELURAHAN", "Kelurahan")))
+        kec = row.kec
+        kel = row.kel
 
+        # folder was already created by run_generate
         folder = os.path.join(base_folder, kec, kel)
-        # hard check: output must remain inside base_folder
-        if not os.path.abspath(folder).startswith(os.path.abspath(base_folder)):
-            audit["action"] = "blocked"
-            audit["message"] = "directory_traversal_detected"
-            audit_write(audit)
-            logging.error(f"Blocked directory traversal attempt: {folder}")
-            return ("error", "Illegal folder path detected")
-
-        os.makedirs(folder, exist_ok=True)
-
-        filename = sanitize_filename(f"{nik}-{no_kk}-{nama}.png")
         filepath = os.path.join(folder, filename)
 
-        if not os.path.abspath(filepath).startswith(os.path.abspath(base_folder)):
+        # hard check: output must remain inside base_folder (already absolute,
+        # so normpath is enough - no abspath/getcwd per row); covers kec/kel too
+        if not os.path.normpath(filepath).startswith(base_folder + os.sep):
             audit["action"] = "blocked"
             audit["message"] = "file_escape_detected"
             audit_write(audit)
             logging.error(f"Blocked file escape attempt: {filepath}")
-            return ("error", "Illegal file path detected")
-
-        if os.path.exists(filepath):
-            audit["action"] = "skip"
-            audit["message"] = "exists"
-            audit_write(audit)
-            logging.info(f"SKIP: {filename} sudah ada.")
-            return ("skip", filename)
+            return ("error", "Illegal file path detected", None)
 
         if len(qr_value) > MAX_QR_CONTENT_LENGTH:
             audit["action"] = "invalid"
             audit["message"] = "qr_content_too_long"
             audit_write(audit)
-            return ("invalid", "QR content too long")
-
-        qr = qrcode.QRCode(
-            version=3,
-            error_correction=qrcode.constants.ERROR_CORRECT_H,
-            box_size=10,
-            border=4,
-        )
-        qr.add_data(qr_value)
-        qr.make(fit=True)
-
-        img = qr.make_image(fill_color="black", back_color="white").convert("RGB")
-        width, height = img.size
-        img = img.resize((width * 6, height * 6), Image.LANCZOS)
-
-        # write image safely (atomic write pattern)
-        tmp_fp = filepath + ".tmp"
-        img.save(tmp_fp, format="PNG", quality=100)
-        os.replace(tmp_fp, filepath)
+            return ("invalid", "QR content too long", None)
+
+        png_bytes = _render_qr_png_bytes(qr_value)
+
+        if ATOMIC_WRITES:
+            # write image safely (atomic write pattern)
+            tmp_fp = filepath + ".tmp"
+            with open(tmp_fp, "wb") as fh:
+                fh.write(png_bytes)
+            os.replace(tmp_fp, filepath)
+        else:
+            with open(filepath, "wb") as fh:
+                fh.write(png_bytes)
 
         audit["action"] = "ok"
         audit["message"] = filename
         audit_write(audit)
-        logging.info(f"OK: {filename} berhasil dibuat.")
-        return ("ok", filename)
+        return ("ok", os.path.join(kec, kel, filename), png_bytes)
 
     except Exception as e:
         logging.error(f"ERROR saat membuat QR (row {row_idx}): {e}")
@@ -179,7 +277,18 @@ def generate_qr(row_idx: int, row, base_folder: str):
             "message": str(e)
         }
         audit_write(audit)
-        return ("error", str(e))
+        return ("error", str(e), None)
+
+def process_chunk(chunk, base_folder: str):
+    """
+    Run generate_qr over a list of (row_idx, row) pairs inside one worker,
+    so the executor handles one task per chunk instead of one per row.
+    """
+    return [generate_qr(row_idx, row, base_folder) for row_idx, row in chunk]
+
+def _chunked(iterable, size: int):
+    it = iter(iterable)
+    return iter(lambda: list(islice(it, size)), [])
 
 
 # ===== File validation helpers =====
@@ -215,6 +324,21 @@ def validate_input_file(file_path: str):
         raise Exception("Format file tidak didukung atau berbahaya")
 
 
+# ===== Input readers =====
+# dtype=str: no type inference, and NIK/KK are never read as float (precision loss)
+def read_excel_fast(file_path: str) -> pd.DataFrame:
+    try:
+        # Rust-backed reader (python-calamine), much faster than openpyxl
+        return pd.read_excel(file_path, engine="calamine", dtype=str)
+    except ImportError:
+        return pd.read_excel(file_path, dtype=str)
+
+def read_csv_fast(file_path: str, encoding: str) -> pd.DataFrame:
+    # C engine: unlike pyarrow it pads short rows with NaN and applies dtype=str
+    # while parsing, so NIK/KK columns with blanks never go through float
+    return pd.read_csv(file_path, encoding=encoding, dtype=str)
+
+
 # ===== Public API function =====
 def run_generate(file_path: str, output_folder: str, signature: str = None):
     """
@@ -236,25 +360,36 @@ def run_generate(file_path: str, output_folder: str, signature: str = None):
             raise Exception("Signature required but tidak diberikan")
         if not SIGNATURE_SECRET:
             raise Exception("Server tidak dikonfigurasi dengan SIGNATURE_SECRET")
-        if not hmac_verify_filepath(file_path, signature, SIGNATURE_SECRET):
-            raise Exception("Signature file tidak valid")
 
-    # sandboxed processing dir
-    with tempfile.TemporaryDirectory(prefix="generate_sandbox_") as tmpdir:
-        # copy input file to sandbox for safe processing
-        sandbox_file = os.path.join(tmpdir, "input" + os.path.splitext(file_path)[1])
-        shutil.copyfile(file_path, sandbox_file)
+    # sandboxed processing dir, only when a signature is required: the HMAC is
+    # checked on the sandbox copy, so the bytes processed are the bytes verified
+    # even if file_path changes afterwards; otherwise the copy is pure extra I/O,
+    # so read in place
+    if REQUIRE_SIGNATURE:
+        sandbox = tempfile.TemporaryDirectory(prefix="generate_sandbox_", dir=SANDBOX_DIR)
+    else:
+        sandbox = contextlib.nullcontext()
+    with sandbox as tmpdir:
+        if tmpdir:
+            # copy input file to sandbox for safe processing
+            # (copyfile already uses sendfile() on Linux, no userspace bounce)
+            sandbox_file = os.path.join(tmpdir, "input" + os.path.splitext(file_path)[1])
+            shutil.copyfile(file_path, sandbox_file)
+            if not hmac_verify_filepath(sandbox_file, signature, SIGNATURE_SECRET):
+                raise Exception("Signature file tidak valid")
+        else:
+            sandbox_file = file_path
 
         # read dataframe from sandbox file
         lower = sandbox_file.lower()
         if lower.endswith(".xlsx") or lower.endswith(".xls"):
-            df = pd.read_excel(sandbox_file)
+            df = read_excel_fast(sandbox_file)
         elif lower.endswith(".csv"):
             # read as text with fallback encoding detection (utf-8 then latin-1)
             try:
-                df = pd.read_csv(sandbox_file, encoding="utf-8")
+                df = read_csv_fast(sandbox_file, encoding="utf-8")
             except Exception:
-                df = pd.read_csv(sandbox_file, encoding="latin-1")
+                df = read_csv_fast(sandbox_file, encoding="latin-1")
         else:
             raise Exception("Format file tidak didukung")
 
@@ -263,41 +398,121 @@ def run_generate(file_path: str, output_folder: str, signature: str = None):
         if missing:
             raise Exception(f"Kolom wajib hilang: {missing}")
 
+        # clean & validate whole columns at once instead of per row
+        nik = clean_number_series(df["NO IDENTITAS"])
+        no_kk = clean_number_series(df["NOMOR KK"])
+        nama = sanitize_filename_series(str_series(df["NAMA LENGKAP"]).str.replace(" ", "_"))
+        tasks = pd.DataFrame({
+            "nik": nik,
+            "kk": no_kk,
+            "filename": sanitize_filename_series(nik + "-" + no_kk + "-" + nama + ".png"),
+            "kec": sanitize_folder_series(df.get("KECAMATAN", pd.Series("Kecamatan", index=df.index))),
+            "kel": sanitize_folder_series(df.get("KELURAHAN", pd.Series("Kelurahan", index=df.index))),
+            "kode_qr": df["KODE QR"],
+            "valid": nik.str.fullmatch(_NUMBER_16) & no_kk.str.fullmatch(_NUMBER_16),
+        }, columns=QRRow._fields)
+
         # ensure output dir exists and is absolute
         os.makedirs(output_folder, exist_ok=True)
         output_folder = os.path.abspath(output_folder)
 
-        rows = list(df.itertuples(index=False, name=None))
-        # convert rows to dict-like for backward compatibility with old code
-        # but we need column names
-        cols = list(df.columns)
+        # create each (kec, kel) folder once up front instead of a mkdir per row;
+        # both parts are sanitized to [a-zA-Z0-9_-] so they cannot escape output_folder
+        folders = tasks.loc[tasks["valid"], ["kec", "kel"]].drop_duplicates()
+        for kec, kel in folders.itertuples(index=False, name=None):
+            os.makedirs(os.path.join(output_folder, kec, kel), exist_ok=True)
+
+        rows = map(QRRow._make, tasks.itertuples(index=False, name=None))
 
         result = {"generated": 0, "skipped": 0, "invalid": 0, "errors": []}
 
-        # worker submission: keep index for audit mapping
-        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-            futures = []
-            for idx, row_tuple in enumerate(rows):
-                row_dict = {cols[i]: row_tuple[i] for i in range(len(cols))}
-                futures.append(executor.submit(generate_qr, idx, row_dict, output_folder))
-
-            for fut in as_completed(futures):
-                status, msg = fut.result()
-                if status == "ok":
-                    result["generated"] += 1
-                elif status == "skip":
-                    result["skipped"] += 1
-                elif status == "invalid":
-                    result["invalid"] += 1
-                else:
-                    result["errors"].append(msg)
-
-        # Create ZIP hasil (name sanitized)
-        # safe_zip_base = sanitize_filename(os.path.basename(output_folder))
-        # Use output_folder as base to ensure it is created in the parent dir (OUTPUT_BASE)
-        zip_path = shutil.make_archive(output_folder, 'zip', output_folder)
+        # one directory walk instead of a stat() per row; relative paths
+        # (kec/kel/filename) since the same filename may sit in several folders
+        existing = {
+            os.path.relpath(os.path.join(root, name), output_folder)
+            for root, _, names in os.walk(output_folder)
+            for name in names
+        }
+        seen = set()
+
+        # keep index for audit mapping; invalid and existing rows are counted
+        # here, never submitted
+        pending = []
+        skipped_paths = []
+        for idx, row in enumerate(rows):
+            if not row.valid:
+                audit_invalid(idx, row.nik, row.kk)
+                result["invalid"] += 1
+                continue
+            relpath = os.path.join(row.kec, row.kel, row.filename)
+            if relpath in seen or relpath in existing:
+                audit_row(idx, row.nik, row.kk, "skip", "exists")
+                result["skipped"] += 1
+                if relpath not in seen:
+                    # produced by an earlier run: still part of the download
+                    skipped_paths.append(relpath)
+            else:
+                pending.append((idx, row))
+            seen.add(relpath)
+
+        # only the lightweight QRRow tuples are needed from here on
+        del df, tasks, rows, nik, no_kk, nama, folders
+        gc.collect()
+
+        # workers send audit entries back here; flush first so a forked
+        # worker doesn't inherit pending audit lines
+        audit_flush()
+        audit_queue = MP_CONTEXT.Queue()
+        audit_thread = threading.Thread(target=_audit_drain, args=(audit_queue,), daemon=True)
+        audit_thread.start()
+
+        # ZIP hasil is streamed while workers produce images (no re-read pass afterwards);
+        # placed next to output_folder, i.e. in the parent dir (OUTPUT_BASE).
+        # PNGs are already compressed, so members are STORED rather than deflated again;
+        # ZIP64 keeps archives with >65535 members or >4 GiB valid.
+        # streamed into a .tmp file and renamed only after every row is done, so a
+        # failed run leaves the previous archive intact instead of a partial one
+        zip_path = output_folder + ".zip"
+        zip_tmp = zip_path + ".tmp"
+        try:
+            with open(zip_tmp, "wb", buffering=1 << 20) as zip_fh, \
+                    zipfile.ZipFile(zip_fh, "w", compression=zipfile.ZIP_STORED, allowZip64=True) as zf, \
+                    ProcessPoolExecutor(max_workers=MAX_WORKERS, mp_context=MP_CONTEXT,
+                                        initializer=init_worker, initargs=(audit_queue,)) as executor:
+                # QR encoding is CPU-bound: use processes, one task per CHUNK_SIZE rows
+                # to cut per-task IPC and future bookkeeping
+                chunks = _chunked(pending, CHUNK_SIZE)
+                results = executor.map(process_chunk, chunks, repeat(output_folder))
+
+                # archive the already existing files while workers run
+                for relpath in skipped_paths:
+                    zf.write(os.path.join(output_folder, relpath), arcname=relpath)
+
+                for chunk_results in results:
+                    for status, msg, png_bytes in chunk_results:
+                        if status == "ok":
+                            zf.writestr(msg, png_bytes)
+                            result["generated"] += 1
+                        elif status == "invalid":
+                            result["invalid"] += 1
+                        else:
+                            result["errors"].append(msg)
+            os.replace(zip_tmp, zip_path)
+        except BaseException:
+            with contextlib.suppress(OSError):
+                os.remove(zip_tmp)
+            raise
+        finally:
+            audit_queue.put(None)
+            audit_thread.join()
+            # don't leave buffered audit lines in memory if the run failed
+            audit_close()
+
         result["zip_filename"] = os.path.basename(zip_path)
 
-        logging.info(f"SELESAI. Hasil: {result}")
+        # per-row results are in the audit log; the app log only gets the totals
+        logging.info("SELESAI. generated=%d skipped=%d invalid=%d errors=%d",
+                     result["generated"], result["skipped"], result["invalid"], len(result["errors"]))
         audit_write({"ts": time.time(), "action": "finished", "result": result})
+        audit_close()
         return result